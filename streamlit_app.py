@@ -10,14 +10,23 @@
 # - Allows CSV download per user
 #
 # Run:
-#   pip install streamlit pandas numpy
+#   pip install streamlit pandas numpy pyarrow   (optional: numba)
 #   streamlit run streamlit_app.py
 # ---------------------------------------------------------
 
+import io
 import os
 import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import streamlit as st
+from pandas.api.types import union_categoricals
+
+try:
+    import numba  # optional: JIT for classify_reasons, NumPy fallback otherwise
+except ImportError:
+    numba = None
 
 st.set_page_config(
     page_title="Property Match Recommender (Assignment Demo)",
@@ -30,11 +39,42 @@ st.set_page_config(
 # -----------------------------
 DEFAULT_CSV = "match_recommendations_top10_per_user.csv"
 
+# Files above this size are read + coerced in chunks to cap peak memory
+CHUNKED_READ_BYTES = 200_000_000
+CHUNK_ROWS = 500_000
+
 # Weights used in scoring (must match your notebook)
 W = {"price": 0.30, "bed": 0.18, "bath": 0.10, "type": 0.12, "cond": 0.08, "year": 0.07, "size": 0.07, "loc": 0.08}
 
 COMP_COLS = ["s_price", "s_bed", "s_bath", "s_type", "s_cond", "s_year", "s_size", "s_loc"]
+COMP_NAMES = np.array(["price", "bed", "bath", "type", "cond", "year", "size", "loc"])  # aligned with COMP_COLS
+W_VEC = np.array([W[k] for k in COMP_NAMES], dtype=np.float32)
+CAT_COLS = ["User ID", "Property ID", "Location", "Type", "Condition"]
+NUM_COLS = ["MatchScore", "Price", "Size", "Bedrooms", "Bathrooms", "Year Built", "g_budget"]
 META_COLS = ["User ID", "Property ID", "Location", "Type", "Condition", "Bedrooms", "Bathrooms", "Size", "Year Built", "Price", "MatchScore", "g_budget"]
+READ_COLS = frozenset(META_COLS + COMP_COLS)
+
+# Table columns + sort choices (module-level so reruns don't rebuild them)
+BASE_COLS = ["MatchScore", "Property ID", "Location", "Type", "Condition", "Bedrooms", "Bathrooms", "Size", "Year Built", "Price", "g_budget", "Why this matched"]
+SORT_OPTIONS = {
+    "MatchScore (desc)": ("MatchScore", False),
+    "Price (asc)": ("Price", True),
+    "Price (desc)": ("Price", False),
+    "Size (desc)": ("Size", False),
+    "Year Built (desc)": ("Year Built", False),
+    "Budget gate (desc)": ("g_budget", False),
+}
+
+# dtypes for the CSV read (columns absent from the file are simply ignored)
+SCHEMA = {
+    **{c: "float32" for c in NUM_COLS},
+    **{c: "float32" for c in COMP_COLS},
+    "User ID": "string",
+    "Property ID": "string",
+    "Location": "category",
+    "Type": "category",
+    "Condition": "category",
+}
 
 # -----------------------------
 # Helpers
@@ -51,156 +91,321 @@ def format_money(x):
         return "—"
     return f"{int(round(x)):,}"
 
-def clamp01(x):
-    x = safe_float(x, 0.0)
-    return float(np.clip(x, 0.0, 1.0))
+def as_labels(s: pd.Series) -> pd.Series:
+    """Strings (or a categorical) with missing values as "nan", like str(x); pandas 3's astype(str) keeps NaN."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        if s.isna().any():
+            if "nan" not in s.cat.categories:
+                s = s.cat.add_categories("nan")
+            s = s.fillna("nan")
+        return s
+    return s.astype(object).where(s.notna(), "nan").astype(str)
+
+def to_intish(s: pd.Series) -> pd.Series:
+    """Vectorized str(int(float(x))) for values that parse as finite numbers; everything else stays as-is."""
+    num = pd.to_numeric(s, errors="coerce").astype(np.float64).to_numpy()
+    ok = np.isfinite(num) & (np.abs(num) < 2.0 ** 63)
+    out = as_labels(s).astype(str)  # missing -> "nan", never NaN (would break sorted() on the IDs)
+    if ok.any():
+        out[ok] = np.trunc(num[ok]).astype(np.int64).astype(str)
+    return out
 
-def ensure_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Make sure required columns exist; if missing, create safe defaults."""
-    df = df.copy()
+def ensure_columns(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Make sure required columns exist; if missing, create safe defaults. Also precomputes "Why this matched"."""
+    if copy:
+        df = df.copy()
 
-    # Required numeric cols
-    for c in ["MatchScore", "Price", "Size", "Bedrooms", "Bathrooms", "Year Built", "g_budget"]:
+    # Required numeric cols (already float32 when read via SCHEMA; coerce only the fallback path)
+    for c in NUM_COLS:
         if c not in df.columns:
             df[c] = np.nan
-        df[c] = pd.to_numeric(df[c], errors="coerce")
+        if df[c].dtype != np.float32:
+            df[c] = pd.to_numeric(df[c], errors="coerce", downcast="float").astype(np.float32)
 
     # Component scores (0-1), create neutral defaults if missing
     for c in COMP_COLS:
         if c not in df.columns:
             df[c] = 0.5
-        df[c] = pd.to_numeric(df[c], errors="coerce").fillna(0.5).clip(0, 1)
+        if df[c].dtype != np.float32:
+            df[c] = pd.to_numeric(df[c], errors="coerce", downcast="float").astype(np.float32)
+        df[c] = df[c].fillna(0.5).clip(0, 1)
 
     # Required categoricals
-    for c in ["User ID", "Property ID", "Location", "Type", "Condition"]:
+    for c in CAT_COLS:
         if c not in df.columns:
             df[c] = "Unknown"
-        df[c] = df[c].astype(str)
+        df[c] = as_labels(df[c])
 
     # Coerce ids to int-like strings where possible
-    def to_intish(s):
-        try:
-            return str(int(float(s)))
-        except Exception:
-            return str(s)
+    df["User ID"] = to_intish(df["User ID"])
+    df["Property ID"] = to_intish(df["Property ID"])
+
+    # Reasons depend only on s_* and g_budget, so compute once per load (cached with the CSV)
+    df["Why this matched"] = generate_reason(df)
 
-    df["User ID"] = df["User ID"].apply(to_intish)
-    df["Property ID"] = df["Property ID"].apply(to_intish)
+    # String keys -> category (isin/unique/groupby work on integer codes, far less memory)
+    for c in CAT_COLS:
+        df[c] = df[c].astype("category")
 
     return df
 
-@st.cache_data(show_spinner=False)
+def rewind(src):
+    if hasattr(src, "seek"):
+        src.seek(0)
+
+def read_csv_typed(src) -> pd.DataFrame:
+    """
+    Single-pass typed read with pyarrow, limited to the columns the app uses;
+    falls back to a plain read if values don't parse as SCHEMA.
+    """
+    # pyarrow rejects callable usecols and names missing from the file, so intersect with the header first
+    header = pd.read_csv(src, nrows=0).columns
+    rewind(src)
+    usecols = [c for c in header if c in READ_COLS]
+    try:
+        return pd.read_csv(src, engine="pyarrow", dtype=SCHEMA, usecols=usecols)
+    except ValueError:
+        rewind(src)
+        return pd.read_csv(src, usecols=usecols)
+
+def read_csv_chunked(path: str) -> pd.DataFrame:
+    """
+    Large files: run ensure_columns chunk by chunk so the raw and coerced copies
+    of the whole file never coexist; falls back to untyped chunks like read_csv_typed.
+    """
+    usecols = [c for c in pd.read_csv(path, nrows=0).columns if c in READ_COLS]
+    try:
+        reader = pd.read_csv(path, chunksize=CHUNK_ROWS, dtype=SCHEMA, usecols=usecols, engine="c")
+        parts = [ensure_columns(chunk, copy=False) for chunk in reader]
+    except ValueError:
+        reader = pd.read_csv(path, chunksize=CHUNK_ROWS, usecols=usecols, engine="c")
+        parts = [ensure_columns(chunk, copy=False) for chunk in reader]
+    if not parts:
+        return ensure_columns(pd.read_csv(path, usecols=usecols), copy=False)
+
+    # Each chunk has its own categories; align them so concat keeps the category dtype.
+    # union_categoricals needs one category dtype, and e.g. an all-empty chunk infers object, not str.
+    for c in CAT_COLS:
+        for p in parts:
+            p[c] = p[c].cat.rename_categories(p[c].cat.categories.astype(str))
+        cats = union_categoricals([p[c] for p in parts]).categories
+        for p in parts:
+            p[c] = p[c].cat.set_categories(cats)
+    return pd.concat(parts, ignore_index=True)
+
+# Loaders are cache_resource: every rerun gets the same (read-only) frame back instead of an
+# unpickled copy, so helpers below can key their caches on id(df) rather than hashing its contents.
+# The loader cache keeps those frames alive, so an id is never reused for different data.
+BY_IDENTITY = {pd.DataFrame: id}
+
+@st.cache_resource(show_spinner=False)
 def load_csv_from_path(path: str) -> pd.DataFrame:
-    df = pd.read_csv(path)
+    if os.path.getsize(path) > CHUNKED_READ_BYTES:
+        return read_csv_chunked(path)
+    df = read_csv_typed(path)
     return ensure_columns(df)
 
-@st.cache_data(show_spinner=False)
+@st.cache_resource(show_spinner=False)
 def load_csv_from_upload(uploaded_file) -> pd.DataFrame:
-    df = pd.read_csv(uploaded_file)
+    df = read_csv_typed(uploaded_file)
     return ensure_columns(df)
 
-def compute_weighted_contributions(row: pd.Series) -> pd.DataFrame:
-    parts = {
-        "price": W["price"] * clamp01(row.get("s_price", 0.5)),
-        "bed":   W["bed"]   * clamp01(row.get("s_bed", 0.5)),
-        "bath":  W["bath"]  * clamp01(row.get("s_bath", 0.5)),
-        "type":  W["type"]  * clamp01(row.get("s_type", 0.5)),
-        "cond":  W["cond"]  * clamp01(row.get("s_cond", 0.5)),
-        "year":  W["year"]  * clamp01(row.get("s_year", 0.5)),
-        "size":  W["size"]  * clamp01(row.get("s_size", 0.5)),
-        "loc":   W["loc"]   * clamp01(row.get("s_loc", 0.5)),
-    }
-    out = pd.DataFrame({"component": list(parts.keys()), "weighted_contribution": list(parts.values())})
-    out = out.sort_values("weighted_contribution", ascending=False).reset_index(drop=True)
-    return out
+def user_slice(g: pd.DataFrame) -> pd.DataFrame:
+    """One user's rows sorted by MatchScore (desc), categories trimmed to the values present."""
+    g = g.sort_values("MatchScore", ascending=False).reset_index(drop=True)
+    # Otherwise every slice (and its Arrow/Parquet/hash payloads) carries the dataset-wide ID lists
+    for c in CAT_COLS:
+        g[c] = g[c].cat.remove_unused_categories()
+    return g
+
+@st.cache_resource(show_spinner=False, hash_funcs=BY_IDENTITY)
+def index_by_user(df: pd.DataFrame) -> dict:
+    """User ID -> that user's rows (see user_slice); built once per loaded CSV."""
+    return {uid: user_slice(g) for uid, g in df.groupby("User ID", sort=False, observed=True)}
+
+@st.cache_data(show_spinner=False, hash_funcs=BY_IDENTITY)
+def list_user_ids(df: pd.DataFrame) -> list:
+    return sorted(df["User ID"].unique().tolist())
+
+@st.cache_data(show_spinner=False, hash_funcs=BY_IDENTITY)
+def user_facets(df: pd.DataFrame, uid: str) -> tuple:
+    """Sidebar filter options + slider bounds for one user's rows."""
+    sub = index_by_user(df)[uid]
+    return (
+        sorted(sub["Location"].unique().tolist()),
+        sorted(sub["Type"].unique().tolist()),
+        sorted(sub["Condition"].unique().tolist()),
+        float(sub["Price"].min()), float(sub["Price"].max()),
+        float(sub["Size"].min()), float(sub["Size"].max()),
+    )
 
-def generate_reason(row: pd.Series) -> str:
+@st.cache_data(show_spinner=False)
+def to_csv_bytes(df: pd.DataFrame, cols: tuple) -> bytes:
+    return df[list(cols)].to_csv(index=False).encode("utf-8")
+
+@st.cache_data(show_spinner=False)
+def to_parquet_bytes(df: pd.DataFrame, cols: tuple) -> bytes:
+    buf = io.BytesIO()
+    df[list(cols)].to_parquet(buf, engine="pyarrow", compression="zstd", index=False)
+    return buf.getvalue()
+
+def component_values(row: pd.Series) -> tuple:
+    """The row's COMP_COLS scores as a small hashable tuple (cache key for the explainability tables)."""
+    return tuple(pd.to_numeric(row[COMP_COLS], errors="coerce").fillna(0.5).tolist())
+
+@st.cache_data(show_spinner=False)
+def compute_weighted_contributions(uid: str, pid: str, comp: tuple) -> pd.DataFrame:
+    contrib = np.clip(np.array(comp, dtype=np.float32), 0.0, 1.0) * W_VEC
+    order = np.argsort(-contrib, kind="stable")
+    return pd.DataFrame({"component": COMP_NAMES[order], "weighted_contribution": contrib[order]})
+
+@st.cache_data(show_spinner=False)
+def raw_component_scores(uid: str, pid: str, comp: tuple) -> pd.DataFrame:
+    raw = pd.DataFrame({"component": COMP_NAMES, "s_i": np.clip(np.array(comp, dtype=np.float32), 0.0, 1.0)})
+    return raw.sort_values("s_i", ascending=False)
+
+REASON_LABELS = (
+    "price fit",
+    "bedroom match",
+    "bathroom match",
+    "property type match",
+    "condition match",
+    "modernity/year match",
+    "size/spaciousness match",
+    "location intent match",
+)  # aligned with COMP_COLS
+BUDGET_LABELS = ("within budget", "slightly above budget (small penalty)", "over budget (strong penalty)")
+
+if numba is not None:
+    @numba.njit
+    def classify_reasons(comp, g, strong_idx_out, weak_idx_out, budget_out):
+        """
+        NumPy arrays only: comp (N, 8) float32 in [0, 1], g (N,) float32; outputs are int8, pre-filled with -1.
+        strong/weak_idx_out get the first k component indices (COMP_COLS order) at >=0.80 / <=0.35;
+        budget_out gets an index into BUDGET_LABELS (-1 when g_budget is NaN).
+        """
+        for i in range(comp.shape[0]):
+            gi = g[i]
+            if gi >= 0.98:
+                budget_out[i] = 0
+            elif gi >= 0.85:
+                budget_out[i] = 1
+            elif not np.isnan(gi):
+                budget_out[i] = 2
+
+            ns = 0
+            nw = 0
+            for j in range(comp.shape[1]):
+                v = comp[i, j]
+                if v >= 0.80 and ns < strong_idx_out.shape[1]:
+                    strong_idx_out[i, ns] = j
+                    ns += 1
+                if v <= 0.35 and nw < weak_idx_out.shape[1]:
+                    weak_idx_out[i, nw] = j
+                    nw += 1
+else:
+    def classify_reasons(comp, g, strong_idx_out, weak_idx_out, budget_out):
+        """NumPy fallback with the same calling convention as the Numba kernel."""
+        budget_out[:] = np.select([g >= 0.98, g >= 0.85, ~np.isnan(g)], [0, 1, 2], default=-1)
+        for mask, out in ((comp >= 0.80, strong_idx_out), (comp <= 0.35, weak_idx_out)):
+            # stable argsort of ~mask puts the matching columns first, in COMP_COLS order
+            idx = np.argsort(~mask, axis=1, kind="stable")[:, :out.shape[1]]
+            out[:] = np.where(np.take_along_axis(mask, idx, axis=1), idx, -1)
+
+def generate_reason(df: pd.DataFrame) -> pd.Series:
     """
-    Creates a concise, interview-friendly explanation using sub-scores.
+    Creates a concise, interview-friendly explanation per row using sub-scores.
+    Thresholds run in classify_reasons; strings are joined once per distinct outcome.
     """
-    bullets = []
-
-    # Budget gate
-    g = safe_float(row.get("g_budget", np.nan), np.nan)
-    if not np.isnan(g):
-        if g >= 0.98:
-            bullets.append("within budget")
-        elif g >= 0.85:
-            bullets.append("slightly above budget (small penalty)")
-        else:
-            bullets.append("over budget (strong penalty)")
-
-    # Strong components (>=0.80)
-    strong = []
-    mapping = {
-        "s_price": "price fit",
-        "s_bed": "bedroom match",
-        "s_bath": "bathroom match",
-        "s_type": "property type match",
-        "s_cond": "condition match",
-        "s_year": "modernity/year match",
-        "s_size": "size/spaciousness match",
-        "s_loc": "location intent match",
-    }
-    for k, label in mapping.items():
-        v = clamp01(row.get(k, 0.5))
-        if v >= 0.80:
-            strong.append(label)
-
-    if strong:
-        bullets.append("strong on: " + ", ".join(strong[:3]))
-
-    # Weak components (<=0.35) – add only if needed
-    weak = []
-    for k, label in mapping.items():
-        v = clamp01(row.get(k, 0.5))
-        if v <= 0.35:
-            weak.append(label)
-    if weak and len(bullets) < 2:
-        bullets.append("trade-offs: " + ", ".join(weak[:2]))
-
-    if not bullets:
-        return "Balanced match across constraints and preferences."
-    return " • ".join(bullets).capitalize() + "."
-
-def apply_filters(df: pd.DataFrame,
+    n = len(df)
+    comp = np.clip(df[COMP_COLS].to_numpy(dtype=np.float32), 0.0, 1.0)
+    g = pd.to_numeric(df["g_budget"], errors="coerce").to_numpy(dtype=np.float32)
+    strong_idx = np.full((n, 3), -1, dtype=np.int8)
+    weak_idx = np.full((n, 2), -1, dtype=np.int8)
+    budget = np.full(n, -1, dtype=np.int8)
+    classify_reasons(comp, g, strong_idx, weak_idx, budget)
+
+    cache = {}
+    reasons = []
+    for key in zip(budget.tolist(), map(tuple, strong_idx.tolist()), map(tuple, weak_idx.tolist())):
+        text = cache.get(key)
+        if text is None:
+            b, strong, weak = key
+            bullets = [BUDGET_LABELS[b]] if b >= 0 else []
+
+            # Strong components (>=0.80)
+            strong = [REASON_LABELS[j] for j in strong if j >= 0]
+            if strong:
+                bullets.append("strong on: " + ", ".join(strong))
+
+            # Weak components (<=0.35) – add only if needed
+            weak = [REASON_LABELS[j] for j in weak if j >= 0]
+            if weak and len(bullets) < 2:
+                bullets.append("trade-offs: " + ", ".join(weak))
+
+            if not bullets:
+                text = "Balanced match across constraints and preferences."
+            else:
+                text = " • ".join(bullets).capitalize() + "."
+            cache[key] = text
+        reasons.append(text)
+
+    return pd.Series(reasons, index=df.index, dtype=object)
+
+@st.cache_resource(show_spinner=False, hash_funcs=BY_IDENTITY)
+def price_index(df: pd.DataFrame, uid: str) -> tuple:
+    """(row order by Price, Price in that order) for one user's rows; positions match index_by_user(df)[uid]."""
+    prices = index_by_user(df)[uid]["Price"].to_numpy()
+    order = np.argsort(prices, kind="stable")  # NaN sorts last, so searchsorted never selects it
+    return order, prices[order]
+
+def apply_filters(tbl: pa.Table,
                   loc_filter, type_filter, cond_filter,
                   price_range, size_range,
-                  min_score, min_budget_gate) -> pd.DataFrame:
-
-    out = df.copy()
+                  min_score, min_budget_gate,
+                  price_idx=None) -> pa.Table:
+    """
+    Filters one user's Arrow table with pyarrow.compute kernels (vectorized, multi-threaded).
+    Nulls (NaN in the CSV) compare as null and are dropped by Table.filter.
+    """
+    # AND all predicates into one mask, then filter once
+    mask = pc.and_(pc.greater_equal(tbl["MatchScore"], min_score),
+                   pc.greater_equal(tbl["g_budget"], min_budget_gate))
 
     if loc_filter:
-        out = out[out["Location"].isin(loc_filter)]
+        mask = pc.and_(mask, pc.is_in(tbl["Location"], value_set=pa.array(loc_filter)))
     if type_filter:
-        out = out[out["Type"].isin(type_filter)]
+        mask = pc.and_(mask, pc.is_in(tbl["Type"], value_set=pa.array(type_filter)))
     if cond_filter:
-        out = out[out["Condition"].isin(cond_filter)]
-
-    if price_range is not None:
-        out = out[(out["Price"] >= price_range[0]) & (out["Price"] <= price_range[1])]
+        mask = pc.and_(mask, pc.is_in(tbl["Condition"], value_set=pa.array(cond_filter)))
+
+    if price_range is not None and price_idx is not None:
+        # Pre-sorted prices: two binary searches instead of a scan over every row
+        order, sorted_prices = price_idx
+        lo_i = np.searchsorted(sorted_prices, price_range[0], side="left")
+        hi_i = np.searchsorted(sorted_prices, price_range[1], side="right")
+        in_range = np.zeros(tbl.num_rows, dtype=bool)
+        in_range[order[lo_i:hi_i]] = True
+        mask = pc.and_(mask, pa.array(in_range))
+    elif price_range is not None:
+        mask = pc.and_(mask, pc.and_(pc.greater_equal(tbl["Price"], price_range[0]),
+                                     pc.less_equal(tbl["Price"], price_range[1])))
     if size_range is not None:
-        out = out[(out["Size"] >= size_range[0]) & (out["Size"] <= size_range[1])]
-
-    out = out[out["MatchScore"] >= min_score]
-    out = out[out["g_budget"] >= min_budget_gate]
-
-    return out
-
-def style_recs(df: pd.DataFrame):
-    return (
-        df.style.format(
-            {
-                "MatchScore": "{:.2f}",
-                "Price": "{:,.0f}",
-                "Size": "{:,.0f}",
-                "Bedrooms": "{:.0f}",
-                "Bathrooms": "{:.0f}",
-                "Year Built": "{:.0f}",
-                "g_budget": "{:.2f}",
-            }
-        )
-    )
+        mask = pc.and_(mask, pc.and_(pc.greater_equal(tbl["Size"], size_range[0]),
+                                     pc.less_equal(tbl["Size"], size_range[1])))
+
+    return tbl.filter(mask)
+
+# Display formats for the recommendations table (applied client-side by st.dataframe, not per cell in Python)
+RECS_COLUMN_CONFIG = {
+    "MatchScore": st.column_config.NumberColumn(format="%.2f"),
+    "Price": st.column_config.NumberColumn(format="%,.0f"),
+    "Size": st.column_config.NumberColumn(format="%,.0f"),
+    "Bedrooms": st.column_config.NumberColumn(format="%.0f"),
+    "Bathrooms": st.column_config.NumberColumn(format="%.0f"),
+    "Year Built": st.column_config.NumberColumn(format="%.0f"),
+    "g_budget": st.column_config.NumberColumn(format="%.2f"),
+}
 # -----------------------------
 # UI
 # -----------------------------
@@ -220,15 +425,11 @@ with st.sidebar:
     st.header("2) Display settings")
     top_k = st.slider("Top-K to show", 5, 50, 10, 1)
 
-    st.divider()
-    st.header("3) Filters (optional)")
-    min_score = st.slider("Min MatchScore", 0.0, 100.0, 0.0, 1.0)
-    min_budget_gate = st.slider("Min budget gate (g_budget)", 0.0, 1.0, 0.0, 0.05)
-
 # Load CSV
 if uploaded is not None:
     recs_all = load_csv_from_upload(uploaded)
     source_label = "uploaded file"
+    source_key = uploaded.file_id
 else:
     if not os.path.exists(csv_path):
         st.error(
@@ -238,9 +439,15 @@ else:
         st.stop()
     recs_all = load_csv_from_path(csv_path)
     source_label = csv_path
-
-# Build user list
-user_ids = sorted(recs_all["User ID"].unique().tolist())
+    source_key = csv_path
+
+# Build user list + per-user index once per data source; reruns reuse them from session state
+if st.session_state.get("src") != source_key:
+    st.session_state.user_ids = list_user_ids(recs_all)
+    st.session_state.user_index = index_by_user(recs_all)
+    st.session_state.user_table = None
+    st.session_state.src = source_key
+user_ids = st.session_state.user_ids
 if not user_ids:
     st.error("No User IDs found in the CSV. Check your file content.")
     st.stop()
@@ -252,97 +459,110 @@ with cA:
 with cB:
     st.metric("Data source", source_label)
 
-# Filter to user
-user_df = recs_all[recs_all["User ID"] == selected_user_id].copy()
-user_df = user_df.sort_values("MatchScore", ascending=False).reset_index(drop=True)
+# Filter to user (shared cached frame, no copy: nothing below mutates it, each step derives a new frame)
+user_df = st.session_state.user_index[selected_user_id]
 
-# Filters depend on user's subset
-loc_options = sorted(user_df["Location"].unique().tolist())
-type_options = sorted(user_df["Type"].unique().tolist())
-cond_options = sorted(user_df["Condition"].unique().tolist())
+# Arrow copy of the current user's rows, kept across reruns (only one per session, replaced on
+# user change); filter/sort/search run on it and only the top-K rows are converted back to pandas
+cached = st.session_state.user_table
+if cached is None or cached[0] != selected_user_id:
+    st.session_state.user_table = (selected_user_id, pa.Table.from_pandas(user_df, preserve_index=False))
+user_tbl = st.session_state.user_table[1]
 
-price_min, price_max = float(user_df["Price"].min()), float(user_df["Price"].max())
-size_min, size_max = float(user_df["Size"].min()), float(user_df["Size"].max())
+# Filters depend on user's subset
+(loc_options, type_options, cond_options,
+ price_min, price_max, size_min, size_max) = user_facets(recs_all, selected_user_id)
 
 with st.sidebar:
-    # Multi-select filters
-    loc_filter = st.multiselect("Location", loc_options, default=[])
-    type_filter = st.multiselect("Type", type_options, default=[])
-    cond_filter = st.multiselect("Condition", cond_options, default=[])
+    st.divider()
+    st.header("3) Filters (optional)")
+
+    # One form -> adjusting several filters costs one rerun (on Apply), not one per widget
+    with st.form("filters"):
+        min_score = st.slider("Min MatchScore", 0.0, 100.0, 0.0, 1.0)
+        min_budget_gate = st.slider("Min budget gate (g_budget)", 0.0, 1.0, 0.0, 0.05)
+
+        # Multi-select filters
+        loc_filter = st.multiselect("Location", loc_options, default=[])
+        type_filter = st.multiselect("Type", type_options, default=[])
+        cond_filter = st.multiselect("Condition", cond_options, default=[])
 
-    price_range = st.slider("Price range", min_value=int(price_min), max_value=int(price_max),
-                            value=(int(price_min), int(price_max)), step=max(1, int((price_max - price_min) / 100) or 1))
-    size_range = st.slider("Size range (sqft)", min_value=int(size_min), max_value=int(size_max),
-                           value=(int(size_min), int(size_max)), step=max(1, int((size_max - size_min) / 100) or 1))
+        price_range = st.slider("Price range", min_value=int(price_min), max_value=int(price_max),
+                                value=(int(price_min), int(price_max)), step=max(1, int((price_max - price_min) / 100) or 1))
+        size_range = st.slider("Size range (sqft)", min_value=int(size_min), max_value=int(size_max),
+                               value=(int(size_min), int(size_max)), step=max(1, int((size_max - size_min) / 100) or 1))
+
+        st.form_submit_button("Apply")
 
 # Apply filters
 filtered = apply_filters(
-    user_df,
+    user_tbl,
     loc_filter=loc_filter,
     type_filter=type_filter,
     cond_filter=cond_filter,
     price_range=price_range,
     size_range=size_range,
     min_score=min_score,
-    min_budget_gate=min_budget_gate
+    min_budget_gate=min_budget_gate,
+    price_idx=price_index(recs_all, selected_user_id),
 )
 
 # Sorting
-sort_col_map = {
-    "MatchScore (desc)": ("MatchScore", False),
-    "Price (asc)": ("Price", True),
-    "Price (desc)": ("Price", False),
-    "Size (desc)": ("Size", False),
-    "Year Built (desc)": ("Year Built", False),
-    "Budget gate (desc)": ("g_budget", False),
-}
 c1, c2, c3 = st.columns([2, 2, 1], gap="large")
 with c1:
-    sort_choice = st.selectbox("Sort by", list(sort_col_map.keys()), index=0)
+    sort_choice = st.selectbox("Sort by", list(SORT_OPTIONS.keys()), index=0)
 with c2:
     search_pid = st.text_input("Search Property ID (optional)", "")
 with c3:
     show_components = st.toggle("Show component columns", value=False)
 
-sort_col, ascending = sort_col_map[sort_choice]
-filtered = filtered.sort_values(sort_col, ascending=ascending).reset_index(drop=True)
+sort_col, ascending = SORT_OPTIONS[sort_choice]
+filtered = filtered.sort_by([(sort_col, "ascending" if ascending else "descending")])
 
-# Search by Property ID
+# Search by Property ID (regex, like str.contains; the dictionary column is decoded first)
 if search_pid.strip():
-    filtered = filtered[filtered["Property ID"].astype(str).str.contains(search_pid.strip())].reset_index(drop=True)
+    pids = pc.cast(filtered["Property ID"], pa.large_string())
+    filtered = filtered.filter(pc.match_substring_regex(pids, search_pid.strip()))
 
 # Take top-k
-display_df = filtered.head(top_k).copy()
-
-# Add "Why this matched"
-display_df["Why this matched"] = display_df.apply(generate_reason, axis=1)
+display_df = filtered.slice(0, top_k).to_pandas()
+avg_score = pc.mean(filtered["MatchScore"]).as_py()
 
 # Show summary metrics
 m1, m2, m3, m4 = st.columns(4, gap="large")
 m1.metric("Total rows (this user)", f"{len(user_df):,}")
-m2.metric("After filters", f"{len(filtered):,}")
+m2.metric("After filters", f"{filtered.num_rows:,}")
 m3.metric("Top score", f"{user_df['MatchScore'].max():.2f}")
-m4.metric("Avg score (filtered)", f"{filtered['MatchScore'].mean():.2f}" if len(filtered) else "—")
+m4.metric("Avg score (filtered)", f"{avg_score:.2f}" if avg_score is not None else "—")
 
 st.divider()
 st.subheader(f"🏆 Recommendations for User {selected_user_id}")
 
-base_cols = ["MatchScore", "Property ID", "Location", "Type", "Condition", "Bedrooms", "Bathrooms", "Size", "Year Built", "Price", "g_budget", "Why this matched"]
-cols_to_show = base_cols + (COMP_COLS if show_components else [])
+cols_to_show = BASE_COLS + (COMP_COLS if show_components else [])
 
 st.dataframe(
-    style_recs(display_df[cols_to_show]),
+    display_df[cols_to_show],
+    column_config=RECS_COLUMN_CONFIG,
     use_container_width=True,
     hide_index=True
 )
 
-# Download per user
-st.download_button(
-    "Download shown table (CSV)",
-    data=display_df[cols_to_show].to_csv(index=False).encode("utf-8"),
-    file_name=f"user_{selected_user_id}_top_{top_k}.csv",
-    mime="text/csv"
-)
+# Download per user (payloads cached, so unchanged tables aren't re-serialized on every rerun)
+d1, d2 = st.columns(2)
+with d1:
+    st.download_button(
+        "Download shown table (CSV)",
+        data=to_csv_bytes(display_df, tuple(cols_to_show)),
+        file_name=f"user_{selected_user_id}_top_{top_k}.csv",
+        mime="text/csv"
+    )
+with d2:
+    st.download_button(
+        "Download shown table (Parquet)",
+        data=to_parquet_bytes(display_df, tuple(cols_to_show)),
+        file_name=f"user_{selected_user_id}_top_{top_k}.parquet",
+        mime="application/vnd.apache.parquet"
+    )
 
 st.divider()
 st.subheader("🔎 Explainability (pick one property)")
@@ -371,28 +591,18 @@ with left:
         "Price": format_money(row["Price"]),
     })
     st.write("**Why this matched**")
-    st.success(generate_reason(row))
+    st.success(row["Why this matched"])
 
 with right:
-    contrib_df = compute_weighted_contributions(row)
+    # Cached per (user, property); the component tuple makes the key cheap to hash
+    comp = component_values(row)
+    contrib_df = compute_weighted_contributions(selected_user_id, str(chosen_pid), comp)
     st.write("**Weighted contribution by component** (sᵢ × wᵢ)")
     st.bar_chart(contrib_df.set_index("component"))
 
     # Show raw component scores
     st.write("**Raw component scores** (0–1)")
-    raw = pd.DataFrame({
-        "component": ["price", "bed", "bath", "type", "cond", "year", "size", "loc"],
-        "s_i": [
-            clamp01(row.get("s_price", 0.5)),
-            clamp01(row.get("s_bed", 0.5)),
-            clamp01(row.get("s_bath", 0.5)),
-            clamp01(row.get("s_type", 0.5)),
-            clamp01(row.get("s_cond", 0.5)),
-            clamp01(row.get("s_year", 0.5)),
-            clamp01(row.get("s_size", 0.5)),
-            clamp01(row.get("s_loc", 0.5)),
-        ]
-    }).sort_values("s_i", ascending=False)
+    raw = raw_component_scores(selected_user_id, str(chosen_pid), comp)
     st.dataframe(raw, use_container_width=True, hide_index=True)
 
 st.caption(